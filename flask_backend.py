@@ -5,19 +5,31 @@ Flask後端服務 - 語音分離Web API
 """
 
 import os
+import re
 import uuid
 import time
+import queue
 import threading
+import subprocess
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
+import heapq
+import logging
+import shutil
 import traceback
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
+import numpy as np
 import torch
 import torchaudio
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import torchmetrics
 
 # 添加父目錄到Python路徑
@@ -155,12 +167,36 @@ def docs():
     </html>
     """
 
+# 日誌 (LOG_LEVEL=DEBUG 時輸出張量診斷信息)
+logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+log = logging.getLogger('voiceclear')
+log.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
 # 配置
 UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'flask_uploads')
 RESULT_FOLDER = os.getenv('RESULT_FOLDER', 'flask_results')
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 50 * 1024 * 1024))  # 50MB
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'flac', 'ogg', 'm4a'}
+SOUNDFILE_EXTENSIONS = {'wav', 'flac', 'ogg'}  # 可由libsndfile直接解碼的格式
 MODEL_PATH = os.getenv('MODEL_PATH', "D:/data_output/eval/Third_200.pt")
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 4))  # 單次推理最多合併的任務數
+BATCH_WAIT_MS = int(os.getenv('BATCH_WAIT_MS', 50))  # 收集批次的最長等待時間
+USE_TORCH_COMPILE = os.getenv('USE_TORCH_COMPILE', '1') == '1'
+TORCH_COMPILE_MODE = os.getenv('TORCH_COMPILE_MODE', 'reduce-overhead')
+USE_BF16 = os.getenv('USE_BF16', '1') == '1'  # CUDA上以bf16自動混合精度推理
+SAVE_WORKERS = int(os.getenv('SAVE_WORKERS', 2))  # 非同步保存結果的線程數
+CHUNK_SECONDS = float(os.getenv('CHUNK_SECONDS', 10))  # 滑動窗口推理的窗口長度
+CHUNK_OVERLAP = float(os.getenv('CHUNK_OVERLAP', 0.25))  # 相鄰窗口的重疊比例
+CHUNK_SAMPLES = int(CHUNK_SECONDS * 44100)  # 窗口長度 (44.1kHz採樣點)
+USE_ONNX_CPU = os.getenv('USE_ONNX_CPU', '1') == '1'  # 無GPU時以ONNX Runtime推理
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', 'model_cache')  # 匯出模型的快取目錄 (模型目錄通常唯讀掛載)
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', os.path.join(
+    MODEL_CACHE_DIR, os.path.splitext(os.path.basename(MODEL_PATH))[0] + '.onnx'))
+MAX_AUDIO_SECONDS = float(os.getenv('MAX_AUDIO_SECONDS', 300))  # 重用輸出緩衝可增長到的最長音頻長度
+CUDA_MEMORY_FRACTION = float(os.getenv('CUDA_MEMORY_FRACTION', 0.9))  # 本進程可使用的顯存比例
+
+# 由Werkzeug在讀取請求時直接拒絕過大的上傳 (額外1MB留給multipart表單開銷)
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 1024 * 1024
 
 # 創建目錄
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -169,13 +205,127 @@ os.makedirs(RESULT_FOLDER, exist_ok=True)
 # 全局變量
 model = None
 device = None
-tasks = {}  # 任務狀態存儲
+save_pool = ThreadPoolExecutor(max_workers=SAVE_WORKERS, thread_name_prefix='save')
+
+@dataclass(slots=True)
+class Task:
+    """任務狀態"""
+    task_id: str
+    start_time: float
+    input_file: str
+    original_filename: str
+    file_size: int
+    status: str = 'queued'
+    progress: int = 0
+    message: str = '任務已排隊'
+    output_file: str = None
+    si_snr_improvement: float = None
+    audio_duration: float = None
+    processing_time: float = None
+    quality_scores: dict = None
+    error: str = None
+
+tasks = {}  # 任務狀態存儲 task_id -> Task
+tasks_lock = threading.RLock()
+task_expiry_heap = []  # (start_time, task_id) 最小堆，用於按時間清理任務
+
+def add_task(task):
+    """登記新任務"""
+    with tasks_lock:
+        tasks[task.task_id] = task
+        heapq.heappush(task_expiry_heap, (task.start_time, task.task_id))
+
+def update_task(task_id, **fields):
+    """更新任務欄位 (任務已被清理時忽略)"""
+    with tasks_lock:
+        task = tasks.get(task_id)
+        if task is None:
+            return
+        for name, value in fields.items():
+            setattr(task, name, value)
+
+@contextmanager
+def inference_context(device):
+    """分離模型的推理上下文：inference_mode，CUDA支援時加上bf16自動混合精度"""
+    use_bf16 = USE_BF16 and device.type == 'cuda' and torch.cuda.is_bf16_supported()
+    with torch.inference_mode(), torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16):
+        yield
+
+DECODER_LAYER_PATTERN = re.compile(r'mask_gen\.decoder\.tf_dec_layers\.(\d+)\.self_attn\.in_proj_weight')
+
+def count_decoder_layers(model_state):
+    """從state_dict推斷decoder層數 (單次掃描所有鍵，不限制最大層數)"""
+    indices = [int(m.group(1)) for key in model_state if (m := DECODER_LAYER_PATTERN.match(key))]
+    return max(indices, default=0) + 1
+
+class HostBufferPool:
+    """循環重用的鎖頁主機緩衝池
+    
+    每個槽位的緩衝只在容量不足時重新分配；若槽位仍被非同步保存使用，取得時會先等待其完成。
+    只由推理工作線程調用，不需加鎖。
+    """
+    
+    def __init__(self, size):
+        self._buffers = [None] * size
+        self._holds = [None] * size
+        self._next = 0
+    
+    def acquire(self, like):
+        slot = self._next
+        self._next = (slot + 1) % len(self._buffers)
+        
+        if self._holds[slot] is not None:
+            wait([self._holds[slot]])
+            self._holds[slot] = None
+        
+        buffer = self._buffers[slot]
+        if buffer is None or buffer.dtype != like.dtype or buffer.numel() < like.numel():
+            buffer = self._buffers[slot] = torch.empty(like.numel(), dtype=like.dtype, pin_memory=True)
+        return buffer[:like.numel()].view(like.shape), slot
+    
+    def hold(self, slot, future):
+        if slot is not None:
+            self._holds[slot] = future
+
+class NetExportWrapper(torch.nn.Module):
+    """將Net的字典輸入/輸出展開為張量，供ONNX匯出"""
+    
+    def __init__(self, net):
+        super().__init__()
+        self.net = net
+    
+    def forward(self, mixture, label_vector):
+        return self.net({'mixture': mixture, 'label_vector': label_vector})['x']
+
+class OnnxNet:
+    """以ONNX Runtime執行的分離模型，調用方式與Net相同: model(inputs) -> {'x': tensor}"""
+    
+    def __init__(self, onnx_path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = os.cpu_count()
+        self._session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+    
+    def __call__(self, inputs):
+        x, = self._session.run(['x'], {
+            'mixture': inputs['mixture'].float().cpu().numpy(),
+            'label_vector': inputs['label_vector'].float().cpu().numpy()
+        })
+        return {'x': torch.from_numpy(x)}
 
 class ModelManager:
     """模型管理器 - 單例模式"""
     _instance = None
     _model = None
     _device = None
+    _squim = None
+    _label_len = 20
+    _label_vector = None
+    _host_buffers = None
+    _static_shapes = False  # GPU上編譯後的模型固定以 [MAX_BATCH_SIZE, 2, CHUNK_SAMPLES] 推理
+    _ola_output = None
+    _ola_weight = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -188,14 +338,23 @@ class ModelManager:
             return True
             
         try:
-            print("🔄 初始化模型管理器...")
+            log.info("🔄 初始化模型管理器...")
             
             # 設置設備
             self._device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            print(f"✅ 使用設備: {self._device}")
+            log.info("✅ 使用設備: %s", self._device)
+            
+            # 啟用cuDNN自動選擇最快的卷積演算法，並允許TF32矩陣運算 (Ampere以上GPU)
+            if self._device.type == 'cuda':
+                torch.backends.cudnn.benchmark = True
+                torch.backends.cuda.matmul.allow_tf32 = True
+                torch.backends.cudnn.allow_tf32 = True
+                torch.set_float32_matmul_precision('high')
+                device_index = self._device.index if self._device.index is not None else torch.cuda.current_device()
+                torch.cuda.set_per_process_memory_fraction(CUDA_MEMORY_FRACTION, device_index)
             
             # 載入模型
-            print(f"🔄 載入模型: {MODEL_PATH}")
+            log.info("🔄 載入模型: %s", MODEL_PATH)
             checkpoint = torch.load(MODEL_PATH, map_location='cpu', weights_only=False)
             model_state = checkpoint['model_state_dict']
             
@@ -203,12 +362,7 @@ class ModelManager:
             n_labels = model_state['label_embedding.0.weight'].shape[1] if 'label_embedding.0.weight' in model_state else 20
             model_dim = model_state['mask_gen.encoder.dcc_layers.dcc_0.layers.0.bias'].shape[0] if 'mask_gen.encoder.dcc_layers.dcc_0.layers.0.bias' in model_state else 256
             
-            decoder_layers = 1
-            for i in range(10):
-                if f'mask_gen.decoder.tf_dec_layers.{i}.self_attn.in_proj_weight' in model_state:
-                    decoder_layers = i + 1
-                else:
-                    break
+            decoder_layers = count_decoder_layers(model_state)
             
             # 創建模型
             self._model = Net(
@@ -229,16 +383,149 @@ class ModelManager:
             self._model.to(self._device)
             self._model.eval()
             
+            # 預先分配標籤向量 (全1表示處理所有聲音)，每個批次取前B行重用
+            self._label_len = n_labels
+            self._label_vector = torch.ones(MAX_BATCH_SIZE, n_labels, device=self._device)
+            
+            # 回傳輸出用的鎖頁緩衝，數量足夠讓非同步保存與下一個任務同時進行
+            self._host_buffers = HostBufferPool(SAVE_WORKERS + 1)
+            
             epoch = checkpoint.get('epoch', 0)
-            print(f"✅ 模型載入成功 (Epoch: {epoch})")
+            log.info("✅ 模型載入成功 (Epoch: %s)", epoch)
+            
+            # CPU部署改用ONNX Runtime；GPU則編譯模型 (融合運算、減少Python調度開銷)
+            if self._device.type == 'cpu' and USE_ONNX_CPU:
+                self._load_onnx_model()
+            elif USE_TORCH_COMPILE and hasattr(torch, 'compile'):
+                self._compile_model()
+            
+            # 載入SQUIM客觀模型 (常駐記憶體，避免每個任務重新載入)
+            try:
+                from torchaudio.pipelines import SQUIM_OBJECTIVE
+                self._squim = SQUIM_OBJECTIVE.get_model().to(self._device).eval()
+                log.info("✅ SQUIM模型載入成功")
+            except Exception as e:
+                self._squim = None
+                log.warning("⚠️ SQUIM模型載入失敗，將使用備用評估方法: %s", e)
+            
+            # 釋放載入與預熱期間的暫存顯存 (只在啟動時執行一次)
+            if self._device.type == 'cuda':
+                torch.cuda.empty_cache()
+            
             return True
             
         except Exception as e:
-            print(f"❌ 模型初始化失敗: {e}")
+            log.exception("❌ 模型初始化失敗: %s", e)
             return False
     
+    def _compile_model(self):
+        """使用torch.compile編譯模型並預熱，失敗時退回eager模式"""
+        eager_model = self._model
+        try:
+            log.info("🔄 編譯模型 (torch.compile, mode=%s)...", TORCH_COMPILE_MODE)
+            self._model = torch.compile(eager_model, mode=TORCH_COMPILE_MODE, fullgraph=False)
+            # 只在GPU上固定形狀 (避免錄製多個CUDA graph)；CPU上補齊只會徒增計算量
+            self._static_shapes = self._device.type == 'cuda'
+            self._warmup()
+            log.info("✅ 模型編譯完成")
+        except Exception as e:
+            self._model = eager_model
+            self._static_shapes = False
+            log.warning("⚠️ 模型編譯失敗，使用eager模式: %s", e)
+    
+    def _load_onnx_model(self):
+        """匯出 (或讀取快取的) ONNX模型並以ONNX Runtime執行，失敗時保留PyTorch模型"""
+        try:
+            import onnxruntime
+        except ImportError:
+            log.warning("⚠️ 未安裝onnxruntime，使用PyTorch CPU推理")
+            return
+        
+        try:
+            # 快取不存在或比checkpoint舊時重新匯出
+            if not os.path.exists(ONNX_MODEL_PATH) or os.path.getmtime(ONNX_MODEL_PATH) < os.path.getmtime(MODEL_PATH):
+                # 目錄不可寫入時直接略過，不做注定無法保存的匯出
+                export_dir = os.path.dirname(ONNX_MODEL_PATH) or '.'
+                try:
+                    os.makedirs(export_dir, exist_ok=True)
+                except OSError:
+                    pass
+                if not os.access(export_dir, os.W_OK):
+                    log.warning("⚠️ ONNX快取目錄不可寫入 (%s)，略過匯出，使用PyTorch CPU推理", export_dir)
+                    return
+                
+                log.info("🔄 匯出ONNX模型: %s", ONNX_MODEL_PATH)
+                torch.onnx.export(
+                    NetExportWrapper(self._model),
+                    (torch.zeros(1, 2, 44100), torch.ones(1, self._label_len)),
+                    ONNX_MODEL_PATH,
+                    opset_version=17,
+                    input_names=['mixture', 'label_vector'],
+                    output_names=['x'],
+                    dynamic_axes={'mixture': {0: 'B', 2: 'T'}, 'label_vector': {0: 'B'}, 'x': {0: 'B', 2: 'T'}}
+                )
+            
+            self._model = OnnxNet(ONNX_MODEL_PATH)
+            log.info("✅ 使用ONNX Runtime推理 (onnxruntime %s)", onnxruntime.__version__)
+        except Exception as e:
+            log.warning("⚠️ ONNX模型載入失敗，使用PyTorch CPU推理: %s", e)
+    
+    def _warmup(self):
+        """以與正式推理相同形狀的靜音執行一次前向傳播，讓首個真實請求不需承擔編譯成本"""
+        inputs = {
+            'mixture': torch.zeros(MAX_BATCH_SIZE, 2, CHUNK_SAMPLES, device=self._device),
+            'label_vector': self.get_label_vector(MAX_BATCH_SIZE)
+        }
+        with inference_context(self._device):
+            self._model(inputs)
+    
     def get_model(self):
         return self._model, self._device
+    
+    def get_squim(self):
+        return self._squim, self._device
+    
+    def uses_static_shapes(self):
+        """推理輸入是否需補齊為固定形狀 (避免編譯模型重新編譯或錄製新的CUDA graph)"""
+        return self._static_shapes
+    
+    def get_label_vector(self, batch_size):
+        return self._label_vector[:batch_size]
+    
+    def get_ola_buffers(self, lengths):
+        """獲取已清零的重疊相加緩衝 [(輸出 [2, T_i], 權重 [T_i]), ...]
+        
+        GPU上切片重用常駐的緩衝 (內容在下一批推理前有效)，避免可變長度造成顯存碎片；
+        緩衝只按實際出現過的最大批次與長度 (向上取整到窗口長度) 增長，上限為 MAX_AUDIO_SECONDS。
+        超出上限或在CPU上時新分配 (CPU上推理結果會直接交給背景線程保存，不能被下一批覆寫)
+        """
+        max_len = int(MAX_AUDIO_SECONDS * 44100)
+        if self._device.type == 'cuda' and max(lengths) <= max_len:
+            rows, length = len(lengths), max(lengths)
+            if self._ola_output is None or rows > self._ola_output.shape[0] or length > self._ola_output.shape[-1]:
+                if self._ola_output is not None:
+                    rows = max(rows, self._ola_output.shape[0])
+                    length = max(length, self._ola_output.shape[-1])
+                length = min(-(-length // CHUNK_SAMPLES) * CHUNK_SAMPLES, max_len)
+                self._ola_output = self._ola_weight = None  # 先釋放舊緩衝再分配
+                self._ola_output = torch.empty(rows, 2, length, device=self._device)
+                self._ola_weight = torch.empty(rows, length, device=self._device)
+                log.debug("重疊相加緩衝增長為 [%d, 2, %d]", rows, length)
+            
+            buffers = [(self._ola_output[i, :, :n], self._ola_weight[i, :n]) for i, n in enumerate(lengths)]
+            for output, weight in buffers:
+                output.zero_()
+                weight.zero_()
+            return buffers
+        return [(torch.zeros(2, n, device=self._device), torch.zeros(n, device=self._device)) for n in lengths]
+    
+    def get_host_buffer(self, like):
+        """獲取與like形狀、類型相同的鎖頁主機緩衝，返回 (緩衝, 槽位)"""
+        return self._host_buffers.acquire(like)
+    
+    def hold_host_buffer(self, slot, future):
+        """標記緩衝在future完成前仍被使用 (例如非同步保存)"""
+        self._host_buffers.hold(slot, future)
 
 def allowed_file(filename):
     """檢查文件格式是否允許"""
@@ -252,103 +539,102 @@ def allowed_file(filename):
     extension = parts[1].lower()
     return extension in ALLOWED_EXTENSIONS
 
-def calculate_squim_scores(audio, sr=44100):
-    """使用SQUIM計算語音質量評分（無需GT）"""
+@lru_cache(maxsize=16)
+def _get_resampler(orig_sr, new_sr, device_str):
+    """獲取快取的重採樣器 (避免每次重新計算濾波器核)"""
+    return torchaudio.transforms.Resample(orig_sr, new_sr).to(torch.device(device_str))
+
+def to_squim_input(audio, sr):
+    """轉換為SQUIM輸入格式 (單聲道、16kHz、帶batch維度)"""
+    # 先轉單聲道再重採樣，重採樣為線性運算，結果相同但只需處理一個聲道
+    if audio.dim() > 1 and audio.shape[0] > 1:
+        audio = torch.mean(audio, dim=0)
+    
+    # 確保有batch維度
+    if audio.dim() == 1:
+        audio = audio.unsqueeze(0)
+    
+    # SQUIM需要16kHz採樣率
+    if sr != 16000:
+        audio = _get_resampler(sr, 16000, str(audio.device))(audio)
+    
+    return audio
+
+def calculate_squim_scores_batch(audios_16k):
+    """批次計算多段16kHz單聲道音頻的SQUIM評分，所有音頻合併為一次前向傳播"""
     try:
-        print(f"📊 SQUIM輸入音頻形狀: {audio.shape}, 採樣率: {sr}")
-        
-        # 導入torchaudio (移到前面)
-        import torchaudio
-        
-        # SQUIM需要16kHz採樣率
-        if sr != 16000:
-            print(f"🔄 重採樣 {sr}Hz → 16kHz")
-            resampler = torchaudio.transforms.Resample(sr, 16000)
-            audio_16k = resampler(audio)
-        else:
-            audio_16k = audio
-        
-        print(f"📊 重採樣後形狀: {audio_16k.shape}")
-        
-        # 確保是單聲道（SQUIM要求）
-        if audio_16k.dim() > 1 and audio_16k.shape[0] > 1:
-            print("🔄 轉換為單聲道")
-            audio_16k = torch.mean(audio_16k, dim=0)  # 轉為單聲道
-        
-        # 確保有batch維度
-        if audio_16k.dim() == 1:
-            audio_16k = audio_16k.unsqueeze(0)
-            
-        print(f"📊 最終SQUIM輸入形狀: {audio_16k.shape}")
-        print(f"📊 音頻長度: {audio_16k.shape[-1]/16000:.2f}秒")
-        print(f"📊 音頻範圍: [{audio_16k.min():.4f}, {audio_16k.max():.4f}]")
-        
-        # 檢查音頻是否為空或全零
-        if torch.all(audio_16k == 0):
-            print("⚠️ 警告: 音頻全為零！")
-            return {
-                'stoi_estimate': 0.0,
-                'pesq_estimate': 1.0,
-                'si_sdr_estimate': 0.0,
-                'mos_estimate': 1.0
-            }
+        # 獲取常駐的SQUIM模型 - 只使用無參考的客觀指標
+        objective_model, device = ModelManager().get_squim()
+        if objective_model is None:
+            raise RuntimeError("SQUIM模型未載入")
         
-        # 導入SQUIM - 只使用無參考的客觀指標
-        print("🔄 載入SQUIM客觀模型...")
-        try:
-            print(f"📊 torchaudio版本: {torchaudio.__version__}")
-            from torchaudio.pipelines import SQUIM_OBJECTIVE
-        except ImportError as e:
-            print(f"❌ SQUIM導入失敗: {e}")
-            raise e
-        
-        # 確保音頻長度足夠 (SQUIM需要至少0.5秒)
+        # 對齊長度 (SQUIM需要至少0.5秒)，不足部分以零填充
         min_length = int(16000 * 0.5)  # 0.5秒
-        if audio_16k.shape[-1] < min_length:
-            print(f"⚠️ 音頻太短 ({audio_16k.shape[-1]/16000:.2f}s)，填充到0.5s")
-            padding = min_length - audio_16k.shape[-1]
-            audio_16k = torch.nn.functional.pad(audio_16k, (0, padding))
+        max_length = max(max(audio.shape[-1] for audio in audios_16k), min_length)
+        
+        rows = []
+        peaks = []
+        for audio_16k in audios_16k:
+            audio_16k = audio_16k.reshape(-1).to(device, non_blocking=True)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("📊 SQUIM輸入長度: %.2f秒, 音頻範圍: [%.4f, %.4f]",
+                          audio_16k.shape[-1] / 16000, audio_16k.min().item(), audio_16k.max().item())
+            
+            # 確保輸入在正確範圍內 (振幅超過1.0時逐段歸一化，與單獨計算時行為一致)
+            # 全程在設備上計算，不觸發CUDA同步
+            peak = torch.max(torch.abs(audio_16k))
+            peaks.append(peak)
+            audio_16k = audio_16k / peak.clamp_min(1.0)
+            
+            rows.append(torch.nn.functional.pad(audio_16k, (0, max_length - audio_16k.shape[-1])))
         
         # 客觀指標 (STOI, PESQ, SI-SDR估算) - 這些是無參考的
-        print("🔄 計算SQUIM客觀指標...")
-        objective_model = SQUIM_OBJECTIVE.get_model()
-        print(f"📊 客觀模型輸入形狀: {audio_16k.shape}")
-        
-        # 確保輸入在正確範圍內
-        if torch.max(torch.abs(audio_16k)) > 1.0:
-            print("⚠️ 音頻振幅超過1.0，進行歸一化")
-            audio_16k = audio_16k / torch.max(torch.abs(audio_16k))
-        
-        stoi_est, pesq_est, si_sdr_est = objective_model(audio_16k)
-        print(f"📊 客觀指標原始值: STOI={stoi_est}, PESQ={pesq_est}, SI-SDR={si_sdr_est}")
-        
-        # 使用STOI估算MOS (經驗公式)
-        mos_est = 1.0 + stoi_est * 3.5  # STOI 0-1 映射到 MOS 1-4.5
-        print(f"📊 估算MOS值: {mos_est}")
-        
-        result = {
-            'stoi_estimate': float(stoi_est.item()),      # 0-1
-            'pesq_estimate': float(pesq_est.item()),      # 1-4.5
-            'si_sdr_estimate': float(si_sdr_est.item()),  # dB
-            'mos_estimate': float(mos_est.item())         # 1-5
-        }
+        batch = torch.stack(rows, dim=0)
+        log.debug("🔄 計算SQUIM客觀指標，批次形狀: %s", tuple(batch.shape))
+        with torch.inference_mode(), torch.autocast(device_type=device.type, dtype=torch.float16,
+                                                    enabled=device.type == 'cuda'):
+            stoi_est, pesq_est, si_sdr_est = objective_model(batch)
+        # 指標與全零檢查合併為一個張量，只做一次設備→主機傳輸 (一次同步)
+        stats = torch.stack([
+            stoi_est.float(), pesq_est.float(), si_sdr_est.float(),
+            (torch.stack(peaks) == 0).float()  # 全零音頻
+        ]).cpu()
+        stoi_est, pesq_est, si_sdr_est, silent = stats.tolist()
+        
+        results = []
+        for i, is_silent in enumerate(silent):
+            if is_silent:
+                log.warning("⚠️ 警告: 音頻全為零！")
+                results.append({
+                    'stoi_estimate': 0.0,
+                    'pesq_estimate': 1.0,
+                    'si_sdr_estimate': 0.0,
+                    'mos_estimate': 1.0
+                })
+                continue
+            
+            results.append({
+                'stoi_estimate': stoi_est[i],                    # 0-1
+                'pesq_estimate': pesq_est[i],                    # 1-4.5
+                'si_sdr_estimate': si_sdr_est[i],                # dB
+                # 使用STOI估算MOS (經驗公式)，STOI 0-1 映射到 MOS 1-4.5
+                'mos_estimate': 1.0 + stoi_est[i] * 3.5          # 1-5
+            })
         
-        print(f"✅ SQUIM計算完成: {result}")
-        return result
+        log.info("✅ SQUIM計算完成: %s", results)
+        return results
         
     except Exception as e:
-        print(f"❌ SQUIM計算錯誤: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ SQUIM計算錯誤: %s", e)
         
         # 如果SQUIM失敗，使用簡單的能量和頻譜分析
-        print("🔄 使用備用評估方法...")
-        return calculate_simple_quality_scores(audio, sr)
+        log.info("🔄 使用備用評估方法...")
+        return [calculate_simple_quality_scores(audio, 16000) for audio in audios_16k]
 
 def calculate_simple_quality_scores(audio, sr=44100):
     """簡單的音頻質量評估（備用方法）"""
     try:
-        print("📊 使用簡單評估方法...")
+        log.info("📊 使用簡單評估方法...")
         
         # 確保是單聲道
         if audio.dim() > 1 and audio.shape[0] > 1:
@@ -365,15 +651,14 @@ def calculate_simple_quality_scores(audio, sr=44100):
         # 計算動態範圍
         dynamic_range = 20 * torch.log10(torch.tensor(peak_amplitude / (rms_energy + 1e-8))).item()
         
-        # 計算頻譜質量 (使用FFT)
-        fft = torch.fft.fft(audio_mono)
-        magnitude = torch.abs(fft)
+        # 計算頻譜質量 (Welch功率譜估計，分段計算，記憶體與音頻長度無關)
+        from scipy.signal import welch
+        freqs, power = welch(audio_mono.detach().cpu().numpy(), fs=sr, nperseg=4096, average='median')
         
         # 計算高頻能量比例
-        total_energy = torch.sum(magnitude ** 2)
-        high_freq_start = len(magnitude) // 4  # 從1/4頻率開始算高頻
-        high_freq_energy = torch.sum(magnitude[high_freq_start:] ** 2)
-        high_freq_ratio = (high_freq_energy / (total_energy + 1e-8)).item()
+        total_energy = power.sum()
+        high_freq_energy = power[freqs > sr / 8].sum()  # sr/8 以上算高頻
+        high_freq_ratio = float(high_freq_energy / (total_energy + 1e-8))
         
         # 根據這些指標估算質量分數
         # RMS能量越高，質量通常越好（但不能太高）
@@ -401,13 +686,14 @@ def calculate_simple_quality_scores(audio, sr=44100):
             'mos_estimate': round(mos_est, 3)
         }
         
-        print(f"✅ 簡單評估完成: {result}")
-        print(f"📊 調試信息: RMS={rms_energy:.4f}, Peak={peak_amplitude:.4f}, Dynamic={dynamic_range:.2f}dB, HighFreq={high_freq_ratio:.3f}")
+        log.info("✅ 簡單評估完成: %s", result)
+        log.debug("📊 調試信息: RMS=%.4f, Peak=%.4f, Dynamic=%.2fdB, HighFreq=%.3f",
+                  rms_energy, peak_amplitude, dynamic_range, high_freq_ratio)
         
         return result
         
     except Exception as e:
-        print(f"❌ 簡單評估也失敗: {e}")
+        log.error("❌ 簡單評估也失敗: %s", e)
         return {
             'stoi_estimate': 0.5,
             'pesq_estimate': 2.0,
@@ -415,142 +701,310 @@ def calculate_simple_quality_scores(audio, sr=44100):
             'mos_estimate': 2.5
         }
 
-def process_audio_task(task_id, input_path, output_path):
-    """後台處理音頻任務"""
+def load_audio(path):
+    """載入音頻，返回 ([C, T] float32 tensor, 採樣率)
+    
+    WAV/FLAC/OGG 直接以libsndfile解碼；其他格式 (MP3/M4A) 由ffmpeg解碼為44.1kHz雙聲道
+    """
+    extension = path.rsplit('.', 1)[-1].lower()
+    
+    if extension in SOUNDFILE_EXTENSIONS:
+        import soundfile as sf
+        audio_data, sr = sf.read(path, dtype='float32', always_2d=True)
+        return torch.from_numpy(np.ascontiguousarray(audio_data.T)), sr
+    
+    sr = 44100
+    result = subprocess.run(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-i', path,
+         '-f', 'f32le', '-acodec', 'pcm_f32le', '-ar', str(sr), '-ac', '2', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    audio_data = np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, 2)
+    return torch.from_numpy(audio_data.T.copy()), sr
+
+def prepare_audio(task_id, input_path):
+    """載入並預處理音頻，返回 (44.1kHz雙聲道mixture, 16kHz單聲道MIX, 採樣率)"""
+    update_task(task_id, status='processing', progress=10, message='正在載入音頻...')
+    
+    # 載入音頻 (支持多種格式)
     try:
-        # 更新任務狀態
-        tasks[task_id]['status'] = 'processing'
-        tasks[task_id]['progress'] = 10
-        tasks[task_id]['message'] = '正在載入音頻...'
-        
-        # 獲取模型
-        model, device = ModelManager().get_model()
-        if model is None:
-            raise Exception("模型未初始化")
-        
-        # 載入音頻 (支持多種格式)
+        mixture, sr = load_audio(input_path)
+    except Exception as e:
+        log.warning("⚠️ 音頻解碼失敗: %s", e)
+        # 嘗試使用librosa作為備用
         try:
-            mixture, sr = torchaudio.load(input_path)
-        except Exception as e:
-            print(f"⚠️ torchaudio載入失敗: {e}")
-            # 嘗試使用librosa作為備用
-            try:
-                import librosa
-                print("🔄 使用librosa載入音頻...")
-                audio_data, sr = librosa.load(input_path, sr=None, mono=False)
-                
-                # 轉換為torch tensor
-                if audio_data.ndim == 1:
-                    # 單聲道，轉為雙聲道
-                    mixture = torch.from_numpy(audio_data).unsqueeze(0).repeat(2, 1).float()
-                else:
-                    # 多聲道
-                    mixture = torch.from_numpy(audio_data).float()
-                    if mixture.shape[0] == 1:
-                        # 如果是單聲道，複製為雙聲道
-                        mixture = mixture.repeat(2, 1)
-                        
-                print(f"✅ librosa載入成功，形狀: {mixture.shape}, 採樣率: {sr}")
-                
-            except ImportError:
-                raise Exception("無法載入音頻：需要安裝librosa來支持M4A格式")
-            except Exception as librosa_error:
-                raise Exception(f"音頻載入失敗: {librosa_error}")
-        
-        original_mixture = mixture.clone()  # 保存原始音頻用於SI-SNR計算
-        
-        tasks[task_id]['progress'] = 20
-        tasks[task_id]['message'] = '正在預處理音頻...'
-        
-        # 音頻預處理
-        if mixture.shape[0] == 1:
-            mixture = mixture.repeat(2, 1)
-        elif mixture.shape[0] > 2:
-            mixture = mixture[:2]
-        
-        if sr != 44100:
-            resampler = torchaudio.transforms.Resample(sr, 44100)
-            mixture = resampler(mixture)
-            original_mixture = resampler(original_mixture)
-            sr = 44100
-        
-        tasks[task_id]['progress'] = 30
-        tasks[task_id]['message'] = '正在執行語音分離...'
-        
-        # 移到GPU
-        mixture = mixture.to(device)
-        label_vector = torch.ones(1, 20, device=device)
+            import librosa
+            log.info("🔄 使用librosa載入音頻...")
+            audio_data, sr = librosa.load(input_path, sr=None, mono=False)
+            
+            # 轉換為torch tensor
+            if audio_data.ndim == 1:
+                # 單聲道，轉為雙聲道
+                mixture = torch.from_numpy(audio_data).unsqueeze(0).repeat(2, 1).float()
+            else:
+                # 多聲道
+                mixture = torch.from_numpy(audio_data).float()
+                if mixture.shape[0] == 1:
+                    # 如果是單聲道，複製為雙聲道
+                    mixture = mixture.repeat(2, 1)
+                    
+            log.info("✅ librosa載入成功，形狀: %s, 採樣率: %s", tuple(mixture.shape), sr)
+            
+        except ImportError:
+            raise Exception("無法載入音頻：需要安裝librosa來支持M4A格式")
+        except Exception as librosa_error:
+            raise Exception(f"音頻載入失敗: {librosa_error}")
+    
+    # MIX直接從原始音頻 (CPU) 轉為16kHz單聲道供SQUIM使用，不經過44.1kHz，也不需複製原始音頻
+    log.debug("MIX音頻形狀: %s, 採樣率: %s", tuple(mixture.shape), sr)
+    mix_16k = to_squim_input(mixture, sr)
+    
+    update_task(task_id, progress=20, message='正在預處理音頻...')
+    
+    # 音頻預處理
+    if mixture.shape[0] == 1:
+        mixture = mixture.repeat(2, 1)
+    elif mixture.shape[0] > 2:
+        mixture = mixture[:2]
+    
+    if sr != 44100:
+        resampler = _get_resampler(sr, 44100, str(mixture.device))
+        mixture = resampler(mixture)
+        sr = 44100
+    
+    return mixture, mix_16k, sr
+
+def plan_windows(length, chunk_len, hop):
+    """計算滑動窗口的起點，最後一個窗口對齊音頻結尾"""
+    if length <= chunk_len:
+        return [0]
+    starts = list(range(0, length - chunk_len, hop))
+    starts.append(length - chunk_len)
+    return starts
+
+def separate_batch(model, device, mixtures):
+    """批次執行語音分離
+    
+    每段 [2, T_i] 音頻切成固定長度、互相重疊的窗口，所有窗口按 MAX_BATCH_SIZE
+    組成批次推理，再以Hann窗加權重疊相加 (overlap-add) 還原成完整音頻。
+    顯存佔用只取決於窗口長度，與音頻總長度無關。
+    """
+    chunk_len = CHUNK_SAMPLES
+    hop = max(1, int(chunk_len * (1 - CHUNK_OVERLAP)))
+    
+    # 切分窗口: (任務索引, 起點, 片段)
+    segments = []
+    for idx, mixture in enumerate(mixtures):
+        for start in plan_windows(mixture.shape[-1], chunk_len, hop):
+            segments.append((idx, start, mixture[:, start:start + chunk_len]))
+    
+    # 重疊相加的累加緩衝 (clamp避免窗口端點權重為零)
+    buffers = ModelManager().get_ola_buffers([mixture.shape[-1] for mixture in mixtures])
+    outputs = [output for output, _ in buffers]
+    weights = [weight for _, weight in buffers]
+    window = torch.hann_window(chunk_len, periodic=False, device=device).clamp_min(1e-3)
+    
+    # 編譯後的模型每種輸入形狀都會重新編譯 (reduce-overhead模式還會多錄製一個CUDA graph)，
+    # 因此把每個窗口補齊到 chunk_len、批次補齊到 MAX_BATCH_SIZE，只使用預熱過的單一形狀
+    static_shapes = ModelManager().uses_static_shapes()
+    
+    for i in range(0, len(segments), MAX_BATCH_SIZE):
+        group = segments[i:i + MAX_BATCH_SIZE]
+        seg_len = chunk_len if static_shapes else max(segment.shape[-1] for _, _, segment in group)
+        
+        # 移到GPU並對齊長度 (模型為因果結構，尾端填充不影響有效區段)
+        batch = torch.stack([
+            torch.nn.functional.pad(segment.to(device), (0, seg_len - segment.shape[-1]))
+            for _, _, segment in group
+        ], dim=0)
+        if static_shapes and len(group) < MAX_BATCH_SIZE:
+            batch = torch.nn.functional.pad(batch, (0, 0, 0, 0, 0, MAX_BATCH_SIZE - len(group)))
+        label_vector = ModelManager().get_label_vector(batch.shape[0])
         
         # 模型推理
         inputs = {
-            'mixture': mixture.unsqueeze(0),
+            'mixture': batch,
             'label_vector': label_vector
         }
         
-        with torch.no_grad():
+        with inference_context(device):
             output = model(inputs)
         
-        pred_audio = output['x'].squeeze(0).cpu()
-        
-        tasks[task_id]['progress'] = 80
-        tasks[task_id]['message'] = '正在計算音質指標...'
-        
-        # 使用SQUIM計算語音質量評分
-        print("🔄 計算PRED音頻的SQUIM評分...")
-        print(f"PRED音頻形狀: {pred_audio.shape}, 採樣率: {sr}")
-        pred_squim = calculate_squim_scores(pred_audio, sr)
-        print(f"PRED SQUIM結果: {pred_squim}")
-        
-        print("🔄 計算MIX音頻的SQUIM評分...")
-        print(f"MIX音頻形狀: {original_mixture.shape}, 採樣率: {sr}")
-        mix_squim = calculate_squim_scores(original_mixture, sr)
-        print(f"MIX SQUIM結果: {mix_squim}")
-        
-        # 計算改善程度
-        quality_improvement = {
-            'stoi_improvement': pred_squim['stoi_estimate'] - mix_squim['stoi_estimate'],
-            'pesq_improvement': pred_squim['pesq_estimate'] - mix_squim['pesq_estimate'],
-            'si_sdr_improvement': pred_squim['si_sdr_estimate'] - mix_squim['si_sdr_estimate'],
-            'mos_improvement': pred_squim['mos_estimate'] - mix_squim['mos_estimate']
-        }
-        
-        print(f"📊 SQUIM改善評分: MOS={quality_improvement['mos_improvement']:.3f}, STOI={quality_improvement['stoi_improvement']:.3f}")
-        
-        # 使用MOS改善作為主要指標
-        main_improvement_score = quality_improvement['mos_improvement']
-        
-        tasks[task_id]['progress'] = 90
-        tasks[task_id]['message'] = '正在保存結果...'
-        
-        # 保存結果
-        torchaudio.save(output_path, pred_audio, sr)
-        
-        # 計算音頻信息
-        audio_duration = pred_audio.shape[1] / sr
-        
-        # 任務完成
-        tasks[task_id]['status'] = 'completed'
-        tasks[task_id]['progress'] = 100
-        tasks[task_id]['message'] = '處理完成！'
-        tasks[task_id]['output_file'] = output_path
-        tasks[task_id]['audio_duration'] = round(audio_duration, 1)
-        tasks[task_id]['processing_time'] = round(time.time() - tasks[task_id]['start_time'], 2)
-        
-        # 存儲SQUIM評分
-        tasks[task_id]['quality_scores'] = {
-            'pred_scores': pred_squim,
-            'mix_scores': mix_squim,
-            'improvements': quality_improvement,
-            'main_improvement': round(main_improvement_score, 3)
-        }
-        
-        print(f"✅ 任務 {task_id} 處理完成")
-        
+        pred_batch = output['x'].float()
+        for j, (idx, start, segment) in enumerate(group):
+            length = segment.shape[-1]
+            w = window if length == chunk_len else torch.hann_window(
+                length, periodic=False, device=device).clamp_min(1e-3)
+            outputs[idx][:, start:start + length] += pred_batch[j, :, :length] * w
+            weights[idx][start:start + length] += w
+    
+    # 結果保留在推理設備上，供SQUIM直接使用
+    return [output.div_(weight) for output, weight in buffers]
+
+def copy_to_host_async(tensor):
+    """將GPU張量非同步複製到重用的鎖頁緩衝，返回 (CPU張量, 緩衝槽位) (讀取前需同步CUDA stream)"""
+    if tensor.device.type != 'cuda':
+        return tensor, None
+    host, slot = ModelManager().get_host_buffer(tensor)
+    host.copy_(tensor, non_blocking=True)
+    return host, slot
+
+def finalize_task(task_id, pred_audio, mix_16k, sr, output_path):
+    """計算音質指標、保存結果並更新任務狀態"""
+    update_task(task_id, progress=80, message='正在計算音質指標...')
+    
+    # 先發起PRED的回傳複製，與SQUIM計算重疊進行
+    pred_cpu, buffer_slot = copy_to_host_async(pred_audio)
+    
+    # 使用SQUIM計算語音質量評分
+    log.info("🔄 計算PRED/MIX音頻的SQUIM評分...")
+    log.debug("PRED音頻形狀: %s, 採樣率: %s", tuple(pred_audio.shape), sr)
+    pred_squim, mix_squim = calculate_squim_scores_batch([to_squim_input(pred_audio, sr), mix_16k])
+    log.debug("PRED SQUIM結果: %s", pred_squim)
+    log.debug("MIX SQUIM結果: %s", mix_squim)
+    
+    # 計算改善程度
+    quality_improvement = {
+        'stoi_improvement': pred_squim['stoi_estimate'] - mix_squim['stoi_estimate'],
+        'pesq_improvement': pred_squim['pesq_estimate'] - mix_squim['pesq_estimate'],
+        'si_sdr_improvement': pred_squim['si_sdr_estimate'] - mix_squim['si_sdr_estimate'],
+        'mos_improvement': pred_squim['mos_estimate'] - mix_squim['mos_estimate']
+    }
+    
+    log.info("📊 SQUIM改善評分: MOS=%.3f, STOI=%.3f",
+             quality_improvement['mos_improvement'], quality_improvement['stoi_improvement'])
+    
+    # 使用MOS改善作為主要指標
+    main_improvement_score = quality_improvement['mos_improvement']
+    
+    update_task(task_id, progress=90, message='正在保存結果...')
+    
+    # 確保非同步複製已完成
+    if pred_audio.device.type == 'cuda':
+        torch.cuda.current_stream(pred_audio.device).synchronize()
+    
+    # 計算音頻信息
+    audio_duration = pred_audio.shape[-1] / sr
+    quality_scores = {
+        'pred_scores': pred_squim,
+        'mix_scores': mix_squim,
+        'improvements': quality_improvement,
+        'main_improvement': round(main_improvement_score, 3)
+    }
+    
+    # 在背景線程保存結果，工作線程可直接開始下一批推理；保存完成後才標記任務完成
+    future = save_pool.submit(torchaudio.save, output_path, pred_cpu, sr)
+    ModelManager().hold_host_buffer(buffer_slot, future)
+    future.add_done_callback(partial(complete_task, task_id, output_path, audio_duration, quality_scores))
+
+def complete_task(task_id, output_path, audio_duration, quality_scores, future):
+    """保存完成的回調：更新任務為完成 (或保存失敗)"""
+    error = future.exception()
+    if error is not None:
+        fail_task(task_id, error)
+        return
+    
+    # 任務完成，同時存儲SQUIM評分
+    with tasks_lock:
+        task = tasks.get(task_id)
+        if task is not None:
+            task.status = 'completed'
+            task.progress = 100
+            task.message = '處理完成！'
+            task.output_file = output_path
+            task.audio_duration = round(audio_duration, 1)
+            task.processing_time = round(time.time() - task.start_time, 2)
+            task.quality_scores = quality_scores
+    
+    log.info("✅ 任務 %s 處理完成", task_id)
+
+def fail_task(task_id, error):
+    """標記任務失敗"""
+    log.error("❌ 任務 %s 處理失敗: %s", task_id, error)
+    update_task(task_id, status='failed', message=f'處理失敗: {str(error)}', error=str(error))
+
+def process_audio_batch(jobs):
+    """後台批次處理音頻任務，jobs 為 (task_id, input_path, output_path) 列表"""
+    # 獲取模型
+    model, device = ModelManager().get_model()
+    if model is None:
+        for task_id, _, _ in jobs:
+            fail_task(task_id, "模型未初始化")
+        return
+    
+    # 逐個載入與預處理，失敗的任務不影響同批次其他任務
+    prepared = []
+    for task_id, input_path, output_path in jobs:
+        try:
+            mixture, mix_16k, sr = prepare_audio(task_id, input_path)
+            prepared.append((task_id, output_path, mixture, mix_16k, sr))
+        except Exception as e:
+            fail_task(task_id, e)
+    
+    if not prepared:
+        return
+    
+    for task_id, _, _, _, _ in prepared:
+        update_task(task_id, progress=30, message='正在執行語音分離...')
+    
+    try:
+        log.info("🔄 批次推理: %d 個任務", len(prepared))
+        pred_audios = separate_batch(model, device, [item[2] for item in prepared])
     except Exception as e:
-        print(f"❌ 任務 {task_id} 處理失敗: {e}")
-        tasks[task_id]['status'] = 'failed'
-        tasks[task_id]['message'] = f'處理失敗: {str(e)}'
-        tasks[task_id]['error'] = str(e)
+        for task_id, _, _, _, _ in prepared:
+            fail_task(task_id, e)
+        return
+    
+    for (task_id, output_path, _, mix_16k, sr), pred_audio in zip(prepared, pred_audios):
+        try:
+            finalize_task(task_id, pred_audio, mix_16k, sr, output_path)
+        except Exception as e:
+            fail_task(task_id, e)
+
+class InferenceWorker:
+    """推理工作線程 - 單一常駐線程從佇列取出任務並以動態批次推理，保持CUDA上下文常駐"""
+    
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """啟動工作線程 (重複調用無副作用)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='inference-worker', daemon=True)
+                self._thread.start()
+    
+    def submit(self, task_id, input_path, output_path):
+        """將任務加入佇列"""
+        self.start()
+        self._queue.put((task_id, input_path, output_path))
+    
+    def _collect_batch(self):
+        """取出一個任務後，在等待窗口內盡量收集更多任務組成批次"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + BATCH_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                process_audio_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+inference_worker = InferenceWorker()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -583,12 +1037,8 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': f'不支援的文件格式，支援格式: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
         
-        # 檢查文件大小
-        file.seek(0, 2)  # 移到文件末尾
-        file_size = file.tell()
-        file.seek(0)  # 重置到開頭
-        
-        if file_size > MAX_FILE_SIZE:
+        # 檢查文件大小 (客戶端有提供時直接判斷，否則在寫入磁碟後判斷)
+        if file.content_length and file.content_length > MAX_FILE_SIZE:
             return jsonify({'error': f'文件過大，最大支援 {MAX_FILE_SIZE/1024/1024:.0f}MB'}), 400
         
         # 生成任務ID
@@ -618,30 +1068,26 @@ def upload_file():
         output_filename = f"{task_id}_output.wav"
         output_path = os.path.join(RESULT_FOLDER, output_filename)
         
-        file.save(input_path)
+        # 以1MB區塊串流寫入磁碟
+        with open(input_path, 'wb') as out:
+            shutil.copyfileobj(file.stream, out, length=1024 * 1024)
+            file_size = out.tell()
+        
+        if file_size > MAX_FILE_SIZE:
+            os.remove(input_path)
+            return jsonify({'error': f'文件過大，最大支援 {MAX_FILE_SIZE/1024/1024:.0f}MB'}), 400
         
         # 初始化任務狀態
-        tasks[task_id] = {
-            'status': 'queued',
-            'progress': 0,
-            'message': '任務已排隊',
-            'start_time': time.time(),
-            'input_file': input_path,
-            'output_file': None,
-            'original_filename': original_filename,
-            'file_size': file_size,
-            'si_snr_improvement': None,
-            'audio_duration': None,
-            'processing_time': None
-        }
+        add_task(Task(
+            task_id=task_id,
+            start_time=time.time(),
+            input_file=input_path,
+            original_filename=original_filename,
+            file_size=file_size
+        ))
         
-        # 啟動後台處理線程
-        thread = threading.Thread(
-            target=process_audio_task,
-            args=(task_id, input_path, output_path)
-        )
-        thread.daemon = True
-        thread.start()
+        # 加入推理佇列，由常駐工作線程處理
+        inference_worker.submit(task_id, input_path, output_path)
         
         return jsonify({
             'task_id': task_id,
@@ -651,79 +1097,79 @@ def upload_file():
             'original_filename': filename
         })
         
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'文件過大，最大支援 {MAX_FILE_SIZE/1024/1024:.0f}MB'}), 413
     except Exception as e:
-        print(f"上傳錯誤: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("上傳錯誤: %s", e)
         return jsonify({'error': f'上傳失敗: {str(e)}'}), 500
 
 @app.route('/api/status/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     """獲取任務狀態"""
-    if task_id not in tasks:
-        return jsonify({'error': '任務不存在'}), 404
-    
-    task = tasks[task_id]
-    
-    # 計算預估剩餘時間
-    estimated_time = None
-    if task['status'] == 'processing' and task['progress'] > 0:
-        elapsed_time = time.time() - task['start_time']
-        if task['progress'] < 100:
-            estimated_time = int((elapsed_time / task['progress']) * (100 - task['progress']))
-    
-    response = {
-        'task_id': task_id,
-        'status': task['status'],
-        'progress': task['progress'],
-        'message': task['message'],
-        'estimated_time': estimated_time,
-        'original_filename': task.get('original_filename'),
-        'file_size': task.get('file_size')
-    }
-    
-    # 如果任務完成，添加結果信息
-    if task['status'] == 'completed':
-        quality_scores = task.get('quality_scores', {})
-        response.update({
-            'audio_duration': task.get('audio_duration'),
-            'processing_time': task.get('processing_time'),
-            'download_url': f'/api/download/{task_id}',
-            
-            # SQUIM評分
-            'quality_improvement': quality_scores.get('main_improvement', 0),
-            'detailed_scores': {
-                'mos_improvement': quality_scores.get('improvements', {}).get('mos_improvement', 0),
-                'stoi_improvement': quality_scores.get('improvements', {}).get('stoi_improvement', 0),
-                'pesq_improvement': quality_scores.get('improvements', {}).get('pesq_improvement', 0),
-                'si_sdr_improvement': quality_scores.get('improvements', {}).get('si_sdr_improvement', 0),
+    with tasks_lock:
+        task = tasks.get(task_id)
+        if task is None:
+            return jsonify({'error': '任務不存在'}), 404
+        
+        # 計算預估剩餘時間
+        estimated_time = None
+        if task.status == 'processing' and task.progress > 0:
+            elapsed_time = time.time() - task.start_time
+            if task.progress < 100:
+                estimated_time = int((elapsed_time / task.progress) * (100 - task.progress))
+        
+        response = {
+            'task_id': task_id,
+            'status': task.status,
+            'progress': task.progress,
+            'message': task.message,
+            'estimated_time': estimated_time,
+            'original_filename': task.original_filename,
+            'file_size': task.file_size
+        }
+        
+        # 如果任務完成，添加結果信息
+        if task.status == 'completed':
+            quality_scores = task.quality_scores or {}
+            response.update({
+                'audio_duration': task.audio_duration,
+                'processing_time': task.processing_time,
+                'download_url': f'/api/download/{task_id}',
                 
-                'pred_quality': quality_scores.get('pred_scores', {}),
-                'mix_quality': quality_scores.get('mix_scores', {})
-            }
-        })
-    elif task['status'] == 'failed':
-        response['error'] = task.get('error')
+                # SQUIM評分
+                'quality_improvement': quality_scores.get('main_improvement', 0),
+                'detailed_scores': {
+                    'mos_improvement': quality_scores.get('improvements', {}).get('mos_improvement', 0),
+                    'stoi_improvement': quality_scores.get('improvements', {}).get('stoi_improvement', 0),
+                    'pesq_improvement': quality_scores.get('improvements', {}).get('pesq_improvement', 0),
+                    'si_sdr_improvement': quality_scores.get('improvements', {}).get('si_sdr_improvement', 0),
+                    
+                    'pred_quality': quality_scores.get('pred_scores', {}),
+                    'mix_quality': quality_scores.get('mix_scores', {})
+                }
+            })
+        elif task.status == 'failed':
+            response['error'] = task.error
     
     return jsonify(response)
 
 @app.route('/api/download/<task_id>', methods=['GET'])
 def download_result(task_id):
     """下載處理結果"""
-    if task_id not in tasks:
-        return jsonify({'error': '任務不存在'}), 404
-    
-    task = tasks[task_id]
+    with tasks_lock:
+        task = tasks.get(task_id)
+        if task is None:
+            return jsonify({'error': '任務不存在'}), 404
+        status, output_file, original_name = task.status, task.output_file, task.original_filename
     
-    if task['status'] != 'completed':
+    if status != 'completed':
         return jsonify({'error': '任務未完成'}), 400
     
-    output_file = task.get('output_file')
     if not output_file or not os.path.exists(output_file):
         return jsonify({'error': '結果文件不存在'}), 404
     
     # 生成友好的文件名
-    original_name = task.get('original_filename', 'audio')
+    original_name = original_name or 'audio'
     name_without_ext = os.path.splitext(original_name)[0]
     download_filename = f"{name_without_ext}_separated.wav"
     
@@ -738,17 +1184,18 @@ def download_result(task_id):
 def list_tasks():
     """列出所有任務（調試用）"""
     task_list = []
-    for task_id, task in tasks.items():
-        task_info = {
-            'task_id': task_id,
-            'status': task['status'],
-            'progress': task['progress'],
-            'original_filename': task.get('original_filename'),
-            'start_time': datetime.fromtimestamp(task['start_time']).isoformat()
-        }
-        if task['status'] == 'completed':
-            task_info['si_snr_improvement'] = task.get('si_snr_improvement')
-        task_list.append(task_info)
+    with tasks_lock:
+        for task_id, task in tasks.items():
+            task_info = {
+                'task_id': task_id,
+                'status': task.status,
+                'progress': task.progress,
+                'original_filename': task.original_filename,
+                'start_time': datetime.fromtimestamp(task.start_time).isoformat()
+            }
+            if task.status == 'completed':
+                task_info['si_snr_improvement'] = task.si_snr_improvement
+            task_list.append(task_info)
     
     return jsonify({'tasks': task_list})
 
@@ -763,7 +1210,7 @@ def cleanup_old_files():
             if os.path.isfile(file_path):
                 if current_time - os.path.getmtime(file_path) > 3600:  # 1小時
                     os.remove(file_path)
-                    print(f"清理上傳文件: {filename}")
+                    log.info("清理上傳文件: %s", filename)
         
         # 清理結果文件（24小時後）
         for filename in os.listdir(RESULT_FOLDER):
@@ -771,41 +1218,55 @@ def cleanup_old_files():
             if os.path.isfile(file_path):
                 if current_time - os.path.getmtime(file_path) > 86400:  # 24小時
                     os.remove(file_path)
-                    print(f"清理結果文件: {filename}")
-        
-        # 清理任務記錄（24小時後）
-        tasks_to_remove = []
-        for task_id, task in tasks.items():
-            if current_time - task['start_time'] > 86400:  # 24小時
-                tasks_to_remove.append(task_id)
-        
-        for task_id in tasks_to_remove:
-            del tasks[task_id]
-            print(f"清理任務記錄: {task_id}")
+                    log.info("清理結果文件: %s", filename)
+        
+        # 清理任務記錄（24小時後），從最小堆依開始時間彈出，只處理已過期的任務
+        with tasks_lock:
+            while task_expiry_heap and current_time - task_expiry_heap[0][0] > 86400:  # 24小時
+                _, task_id = heapq.heappop(task_expiry_heap)
+                tasks.pop(task_id, None)
+                log.info("清理任務記錄: %s", task_id)
             
     except Exception as e:
-        print(f"清理文件錯誤: {e}")
+        log.error("清理文件錯誤: %s", e)
 
-if __name__ == '__main__':
-    print("🚀 啟動Flask語音分離服務...")
-    
-    # 初始化模型
+def cleanup_loop():
+    """每小時執行一次清理"""
+    while True:
+        try:
+            cleanup_old_files()
+        except Exception as e:
+            log.error("清理線程錯誤: %s", e)
+        time.sleep(3600)
+
+def start_services():
+    """初始化模型並啟動推理與清理線程 (開發伺服器與gunicorn worker共用)"""
     model_manager = ModelManager()
     if not model_manager.initialize():
-        print("❌ 模型初始化失敗，服務無法啟動")
-        exit(1)
+        return False
+    
+    # 啟動推理工作線程
+    inference_worker.start()
     
     # 啟動清理線程
-    cleanup_thread = threading.Thread(target=lambda: [cleanup_old_files(), time.sleep(3600)] * 1000)
-    cleanup_thread.daemon = True
+    cleanup_thread = threading.Thread(target=cleanup_loop, name='cleanup', daemon=True)
     cleanup_thread.start()
+    return True
+
+if __name__ == '__main__':
+    log.info("🚀 啟動Flask語音分離服務...")
+    
+    # 初始化模型與背景線程
+    if not start_services():
+        log.error("❌ 模型初始化失敗，服務無法啟動")
+        exit(1)
     
-    print("✅ 服務啟動成功！")
-    print("📡 API端點:")
-    print("   POST /api/upload     - 上傳音頻文件")
-    print("   GET  /api/status/<id> - 查詢處理狀態")
-    print("   GET  /api/download/<id> - 下載處理結果")
-    print("   GET  /api/health     - 健康檢查")
+    log.info("✅ 服務啟動成功！")
+    log.info("📡 API端點:")
+    log.info("   POST /api/upload     - 上傳音頻文件")
+    log.info("   GET  /api/status/<id> - 查詢處理狀態")
+    log.info("   GET  /api/download/<id> - 下載處理結果")
+    log.info("   GET  /api/health     - 健康檢查")
     
-    # 啟動Flask服務
+    # 啟動Flask開發服務 (生產環境請使用: gunicorn -c gunicorn.conf.py flask_backend:app)
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -0,0 +1,36 @@
+"""
+Gunicorn 配置 - 語音分離後端生產環境
+啟動: gunicorn -c gunicorn.conf.py flask_backend:app
+"""
+
+import os
+
+from gunicorn.arbiter import Arbiter
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# 任務狀態與推理佇列都在進程內，且每個worker會各自載入一份模型到GPU，
+# 因此固定單一worker，以線程處理並發的上傳/查詢/下載請求
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# 模型載入與編譯預熱可能需要數分鐘
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = 30
+
+# 不使用preload：CUDA上下文無法在fork之後沿用，模型需在worker內初始化
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'INFO').lower()
+
+def post_worker_init(worker):
+    """worker啟動後初始化模型並啟動推理與清理線程"""
+    from flask_backend import start_services
+
+    if not start_services():
+        worker.log.error("❌ 模型初始化失敗，服務無法啟動")
+        # 以啟動錯誤碼退出，避免master不斷重啟worker
+        raise SystemExit(Arbiter.WORKER_BOOT_ERROR)
@@ -7,21 +7,39 @@ import os
 import sys
 import subprocess
 
+# 依賴檢查通過後建立的標記文件，之後啟動時跳過檢查
+DEPS_SENTINEL = os.path.expanduser('~/.voiceclear_deps_ok')
+
 def install_requirements():
-    """安裝必要的依賴"""
+    """安裝必要的依賴 (設置 VOICECLEAR_SKIP_DEPS 或已檢查過時跳過)"""
+    if os.environ.get('VOICECLEAR_SKIP_DEPS') or os.path.exists(DEPS_SENTINEL):
+        print("✅ 依賴已檢查，跳過")
+        return
+    
     requirements = [
         'flask',
         'flask-cors', 
         'torchmetrics'
     ]
     
+    missing = []
     for req in requirements:
         try:
             __import__(req.replace('-', '_'))
             print(f"✅ {req} 已安裝")
         except ImportError:
-            print(f"🔄 安裝 {req}...")
-            subprocess.check_call([sys.executable, '-m', 'pip', 'install', req])
+            missing.append(req)
+    
+    # 缺少的套件一次安裝，只需啟動一次pip
+    if missing:
+        print(f"🔄 安裝 {' '.join(missing)}...")
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', *missing])
+    
+    try:
+        with open(DEPS_SENTINEL, 'w'):
+            pass
+    except OSError:
+        pass  # 無法寫入時下次啟動再檢查即可
 
 def check_model_file():
     """檢查模型文件是否存在"""
@@ -33,6 +51,16 @@ def check_model_file():
     print(f"✅ 模型文件存在: {model_path}")
     return True
 
+def load_backend():
+    """導入Flask應用 (會連帶載入torch等重型模組，應在檢查完成後才調用)"""
+    # 添加父目錄到Python路徑，以便導入src模組
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if parent_dir not in sys.path:
+        sys.path.insert(0, parent_dir)
+    
+    from flask_backend import app, start_services
+    return app, start_services
+
 def main():
     print("🚀 啟動語音分離後端服務")
     print("=" * 50)
@@ -65,23 +93,14 @@ def main():
     
     try:
         # 導入並運行Flask應用
-        import sys
-        import os
-        
-        # 添加父目錄到Python路徑，以便導入src模組
-        parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        if parent_dir not in sys.path:
-            sys.path.insert(0, parent_dir)
-        
-        from flask_backend import app, ModelManager
+        app, start_services = load_backend()
         
-        # 初始化模型
-        model_manager = ModelManager()
-        if not model_manager.initialize():
+        # 初始化模型並啟動推理與清理線程 (與gunicorn worker相同的啟動流程)
+        if not start_services():
             print("❌ 模型初始化失敗")
             return
             
-        # 啟動服務
+        # 啟動服務 (Flask開發服務；生產環境請使用: gunicorn -c gunicorn.conf.py flask_backend:app)
         app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
         
     except KeyboardInterrupt:
@@ -4,13 +4,47 @@ Web模型應用工具 - 輸入MIX音頻，生成PRED音頻
 基於 test_my_models.py 的簡化版本，專注於單一模型推理
 """
 
+import io
 import os
+import argparse
+import re
 import sys
+import shutil
+import subprocess
 import torch
 import torchaudio
 import time
 from pathlib import Path
 
+# decoder層權重鍵，用於從state_dict推斷decoder層數
+DECODER_LAYER_PATTERN = re.compile(r'mask_gen\.decoder\.tf_dec_layers\.(\d+)\.self_attn\.in_proj_weight')
+
+# 分段推理：每段長度與相鄰段重疊長度 (秒)
+CHUNK_SECONDS = 4
+CHUNK_OVERLAP_SECONDS = 0.5
+# 每次前向傳播同時推理的片段數
+CHUNK_BATCH_SIZE = 4
+
+# 重採樣器快取 (sr, device) -> Resample，避免每次重新計算濾波器核
+_RESAMPLERS = {}
+
+def get_resampler(sr, device):
+    """獲取 sr → 44.1kHz 的重採樣器 (已放到指定設備上)"""
+    key = (sr, str(device))
+    if key not in _RESAMPLERS:
+        _RESAMPLERS[key] = torchaudio.transforms.Resample(sr, 44100).to(device)
+    return _RESAMPLERS[key]
+
+# 標籤向量快取 (n_labels, device, dtype) -> Tensor，內容固定，不需每次請求重新建立
+_LABEL_VECTORS = {}
+
+def get_label_vector(n_labels, device, dtype):
+    """獲取全1標籤向量 [1, n_labels] (表示處理所有聲音)"""
+    key = (n_labels, str(device), dtype)
+    if key not in _LABEL_VECTORS:
+        _LABEL_VECTORS[key] = torch.ones(1, n_labels, device=device, dtype=dtype)
+    return _LABEL_VECTORS[key]
+
 def setup_device():
     """設置計算設備"""
     if torch.cuda.is_available():
@@ -22,12 +56,31 @@ def setup_device():
     
     return device
 
-def load_model(model_path, device):
+def numpy_checkpoint_globals():
+    """checkpoint訓練指標 (如signal_noise_ratio) 中pickle的numpy類型，供weights_only載入時放行"""
+    import numpy as np
+    try:
+        from numpy.core.multiarray import scalar
+    except ImportError:
+        from numpy._core.multiarray import scalar
+    return [scalar, np.dtype]
+
+def load_model(model_path, device, use_fp16=True, use_compile=True, use_tensorrt=False, use_int8=True):
     """
     載入模型
+    use_fp16: 在GPU上轉為半精度 (FP16) 推理
+    use_compile: 使用torch.compile編譯模型 (失敗時自動退回eager模式)
+    use_tensorrt: 在GPU上改用TensorRT引擎推理 (失敗時退回PyTorch)
+    use_int8: 在CPU上將Linear層動態量化為INT8 (量化後不再編譯)
+    返回 (模型, epoch, 標籤數)
     """
     print(f"🔄 載入模型: {os.path.basename(model_path)}")
     
+    # 啟用cuDNN自動選擇最快的卷積演算法，並允許TF32矩陣運算
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    
     try:
         # 添加父目錄到Python路徑
         import sys
@@ -39,8 +92,16 @@ def load_model(model_path, device):
         # 導入模型架構
         from src.training.dcc_tf_binaural import Net
         
-        # 載入checkpoint
-        checkpoint = torch.load(model_path, map_location='cpu', weights_only=False)
+        # 載入checkpoint：mmap延遲讀取張量，weights_only避免完整的pickle反序列化
+        # checkpoint的訓練指標含numpy純量，先加入允許清單 (torch 2.4+)；
+        # 仍不支援時退回完整反序列化，但保留mmap
+        if hasattr(torch.serialization, 'add_safe_globals'):
+            torch.serialization.add_safe_globals(numpy_checkpoint_globals())
+        try:
+            checkpoint = torch.load(model_path, map_location='cpu', weights_only=True, mmap=True)
+        except Exception as e:
+            print(f"   ⚠️ 安全載入失敗，改用完整反序列化: {e}")
+            checkpoint = torch.load(model_path, map_location='cpu', weights_only=False, mmap=True)
         model_state = checkpoint['model_state_dict']
         
         # 從模型state_dict推斷模型參數
@@ -55,13 +116,9 @@ def load_model(model_path, device):
         else:
             model_dim = 256  # 默認值
             
-        # 推斷decoder層數
-        decoder_layers = 1  # 默認1層
-        for i in range(10):
-            if f'mask_gen.decoder.tf_dec_layers.{i}.self_attn.in_proj_weight' in model_state:
-                decoder_layers = i + 1
-            else:
-                break
+        # 推斷decoder層數 (單次掃描所有鍵取最大索引，沒有則默認1層)
+        layer_indices = [int(m.group(1)) for key in model_state if (m := DECODER_LAYER_PATTERN.match(key))]
+        decoder_layers = max(layer_indices) + 1 if layer_indices else 1
                 
         print(f"🔍 模型參數: 標籤={n_labels}, 維度={model_dim}, Decoder層數={decoder_layers}")
         
@@ -85,70 +142,334 @@ def load_model(model_path, device):
         model.eval()
         
         epoch = checkpoint.get('epoch', 0)
+        
+        if use_tensorrt and device.type == 'cuda':
+            try:
+                plan_path = build_tensorrt_engine(model, model_path, n_labels, device)
+                engine = TensorRTNet(plan_path, device)
+                warmup_model(engine, n_labels, device)
+                print(f"✅ 模型載入成功，使用TensorRT引擎 (Epoch: {epoch})")
+                return engine, epoch, n_labels
+            except Exception as e:
+                print(f"   ⚠️ TensorRT不可用，使用PyTorch推理: {e}")
+        
+        if use_fp16 and device.type == 'cuda':
+            model = model.half()
+            print("   使用FP16半精度推理")
+        
+        if device.type == 'cpu':
+            # CPU推理：運算內並行使用所有核心，運算間並行只需一個線程
+            torch.set_num_threads(os.cpu_count())
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass  # 已有並行工作啟動後無法再設置
+            
+            if use_int8:
+                # 動態量化decoder的Linear層 (權重INT8、激活值運行時量化)，卷積保持FP32
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                use_compile = False
+                print("   使用INT8動態量化推理")
+        
+        # 預熱：吸收首次調用的編譯、演算法選擇與kernel初始化開銷
+        if use_compile and hasattr(torch, 'compile'):
+            model = compile_model(model, n_labels, device)
+        else:
+            warmup_model(model, n_labels, device)
+        
         print(f"✅ 模型載入成功 (Epoch: {epoch})")
-        return model, epoch
+        return model, epoch, n_labels
         
     except Exception as e:
         print(f"❌ 模型載入失敗: {str(e)}")
         raise
 
-def process_audio(model, audio_path, output_dir, device):
+def get_model_dtype(model):
+    """模型輸入應使用的精度 (TensorRT引擎固定以FP32輸入，內部自行使用FP16)"""
+    if isinstance(model, TensorRTNet):
+        return torch.float32
+    return next(model.parameters()).dtype
+
+class NetExportWrapper(torch.nn.Module):
+    """將Net的字典輸入/輸出展開為張量，供ONNX匯出"""
+    
+    def __init__(self, net):
+        super().__init__()
+        self.net = net
+    
+    def forward(self, mixture, label_vector):
+        return self.net({'mixture': mixture, 'label_vector': label_vector})['x']
+
+class TensorRTNet:
+    """以TensorRT引擎執行推理，調用方式與Net相同: model(inputs) -> {'x': tensor}"""
+    
+    def __init__(self, plan_path, device):
+        import tensorrt as trt
+        
+        logger = trt.Logger(trt.Logger.WARNING)
+        with open(plan_path, 'rb') as f:
+            self._engine = trt.Runtime(logger).deserialize_cuda_engine(f.read())
+        self._context = self._engine.create_execution_context()
+        self._device = device
+        self._output = None  # 預先分配的輸出緩衝，只在容量不足時重新分配
+    
+    def __call__(self, inputs):
+        mixture = inputs['mixture'].float().contiguous()
+        label_vector = inputs['label_vector'].float().contiguous()
+        
+        # 引擎只支援分段推理的固定形狀 [1, 2, chunk]
+        if not (self._context.set_input_shape('mixture', tuple(mixture.shape))
+                and self._context.set_input_shape('label_vector', tuple(label_vector.shape))):
+            raise ValueError(f"輸入形狀 {tuple(mixture.shape)} 不在TensorRT引擎的profile範圍內")
+        output_shape = tuple(self._context.get_tensor_shape('x'))
+        
+        numel = 1
+        for dim in output_shape:
+            numel *= dim
+        if self._output is None or self._output.numel() < numel:
+            self._output = torch.empty(numel, dtype=torch.float32, device=self._device)
+        output = self._output[:numel].view(output_shape)
+        
+        self._context.set_tensor_address('mixture', mixture.data_ptr())
+        self._context.set_tensor_address('label_vector', label_vector.data_ptr())
+        self._context.set_tensor_address('x', output.data_ptr())
+        # 排入失敗時輸出緩衝仍是上一次的結果，不能當作本次輸出返回
+        if not self._context.execute_async_v3(torch.cuda.current_stream(self._device).cuda_stream):
+            raise RuntimeError("TensorRT推理排入失敗")
+        return {'x': output}
+
+def is_cache_fresh(cache_path, source_path):
+    """快取文件存在且不比來源文件舊"""
+    return os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(source_path)
+
+def build_tensorrt_engine(model, model_path, n_labels, device):
+    """匯出ONNX並以trtexec建立FP16 TensorRT引擎 (已存在且不比checkpoint舊則直接使用)，返回引擎路徑"""
+    base_path = os.path.splitext(model_path)[0]
+    # batch固定為1的匯出，與後端 (動態batch) 的ONNX快取使用不同檔名
+    onnx_path = base_path + '.trt.onnx'
+    # 引擎的profile固定為分段長度，檔名帶上長度，修改 CHUNK_SECONDS 後會重新建立
+    chunk = int(44100 * CHUNK_SECONDS)
+    plan_path = f'{base_path}.{chunk}.plan'
+    
+    if is_cache_fresh(plan_path, model_path):
+        return plan_path
+    
+    if not is_cache_fresh(onnx_path, model_path):
+        print(f"   🔄 匯出ONNX: {onnx_path}")
+        torch.onnx.export(
+            NetExportWrapper(model),
+            (torch.zeros(1, 2, 44100, device=device), torch.ones(1, n_labels, device=device)),
+            onnx_path,
+            opset_version=17,
+            input_names=['mixture', 'label_vector'],
+            output_names=['x'],
+            dynamic_axes={'mixture': {2: 'T'}, 'x': {2: 'T'}}
+        )
+    
+    trtexec = shutil.which('trtexec')
+    if trtexec is None:
+        raise RuntimeError("找不到trtexec，無法建立TensorRT引擎")
+    
+    print(f"   🔄 建立TensorRT引擎: {plan_path}")
+    subprocess.check_call([
+        trtexec,
+        f'--onnx={onnx_path}',
+        '--fp16',
+        f'--saveEngine={plan_path}',
+        f'--minShapes=mixture:1x2x{chunk},label_vector:1x{n_labels}',
+        f'--optShapes=mixture:1x2x{chunk},label_vector:1x{n_labels}',
+        f'--maxShapes=mixture:1x2x{chunk},label_vector:1x{n_labels}',
+    ])
+    return plan_path
+
+def chunk_batch_size(model):
+    """每次前向傳播的片段數 (TensorRT引擎以batch=1建置，只能逐段推理)"""
+    return 1 if isinstance(model, TensorRTNet) else CHUNK_BATCH_SIZE
+
+def warmup_model(model, n_labels, device):
+    """以分段推理實際使用的輸入形狀 (靜音) 執行兩次前向傳播，結果丟棄"""
+    dtype = get_model_dtype(model)
+    dummy = torch.zeros(chunk_batch_size(model), 2, int(44100 * CHUNK_SECONDS), device=device, dtype=dtype)
+    dummy_label = get_label_vector(n_labels, device, dtype)
+    with torch.inference_mode():
+        for _ in range(2):
+            model({'mixture': dummy, 'label_vector': dummy_label})
+
+def compile_model(model, n_labels, device):
+    """編譯模型並以預熱觸發編譯；編譯失敗時返回原始模型"""
+    try:
+        print("   🔄 編譯模型 (torch.compile)...")
+        # 音頻長度每次不同，使用dynamic避免每種長度都重新編譯
+        compiled = torch.compile(model, mode='reduce-overhead', dynamic=True, fullgraph=False)
+        warmup_model(compiled, n_labels, device)
+        print("   ✅ 模型編譯完成")
+        return compiled
+    except Exception as e:
+        print(f"   ⚠️ 模型編譯失敗，使用eager模式: {e}")
+        warmup_model(model, n_labels, device)
+        return model
+
+def separate_chunked(model, mixture, label_vector, sr):
     """
-    處理音頻文件
+    分段推理長音頻，限制峰值顯存
+    mixture: [2, T] (已在推理設備上)，返回 [2, T] FP32
+    以固定長度、互相重疊的片段分批推理 (每批堆疊為一次前向傳播)，寫入預先分配的輸出緩衝，
+    重疊區以Hann窗加權平均，避免片段接縫處的不連續
+    """
+    length = mixture.shape[-1]
+    chunk = int(sr * CHUNK_SECONDS)
+    hop = chunk - int(sr * CHUNK_OVERLAP_SECONDS)
+    
+    if length <= chunk:
+        starts = [0]
+    else:
+        starts = list(range(0, length - chunk, hop))
+        starts.append(length - chunk)  # 最後一段對齊結尾
+    
+    output = torch.zeros(2, length, device=mixture.device)
+    weight = torch.zeros(length, device=mixture.device)
+    window = torch.hann_window(min(chunk, length), periodic=False, device=mixture.device).clamp_min(1e-3)
+    
+    batch_size = chunk_batch_size(model)
+    
+    # GPU上固定以預熱過的 [batch_size, 2, chunk] 推理：編譯後的模型遇到新形狀會重新編譯並錄製新的CUDA graph，
+    # cuDNN也只對預熱的形狀選過演算法。短音頻尾端補零 (模型為因果結構，不影響有效區段)，最後一批補齊批次
+    static_shapes = mixture.device.type == 'cuda'
+    
+    with torch.inference_mode():
+        for i in range(0, len(starts), batch_size):
+            batch_starts = starts[i:i + batch_size]
+            # 除了音頻短於一段的情況，所有片段等長，可直接堆疊
+            segments = torch.stack([mixture[:, start:start + chunk] for start in batch_starts])
+            seg_len = segments.shape[-1]
+            if static_shapes:
+                segments = torch.nn.functional.pad(
+                    segments, (0, chunk - seg_len, 0, 0, 0, batch_size - len(batch_starts)))
+            labels = label_vector.expand(segments.shape[0], -1)
+            pred = model({'mixture': segments, 'label_vector': labels})['x']
+            for j, start in enumerate(batch_starts):
+                output[:, start:start + seg_len] += pred[j, :, :seg_len].float() * window
+                weight[start:start + seg_len] += window
+    
+    return output / weight
+
+def load_audio(audio_path):
+    """
+    載入音頻，返回 ([C, T] FP32, 採樣率)
+    優先以soundfile (libsndfile) 直接解碼，略過torchaudio的後端調度；
+    未安裝soundfile或格式不支援 (如MP3) 時退回torchaudio.load
+    """
+    try:
+        import soundfile as sf
+        data, sr = sf.read(audio_path, dtype='float32', always_2d=True)
+        return torch.from_numpy(data).t().contiguous(), sr
+    except (ImportError, RuntimeError):
+        return torchaudio.load(audio_path)
+
+def create_streams(device):
+    """建立 (H2D, 計算) 兩個CUDA stream，CPU上返回None"""
+    if device.type != 'cuda':
+        return None
+    return tuple(torch.cuda.Stream(device) for _ in range(2))
+
+def upload_audio(audio_path, device, h2d_stream=None):
+    """
+    載入音頻並移到推理設備，返回 (mixture [C, T], 採樣率, 傳輸完成事件)，載入失敗時返回None
+    GPU上以鎖頁記憶體在h2d_stream上非同步傳輸，可與前一個文件的推理重疊
     """
     print(f"\n🎵 處理音頻: {os.path.basename(audio_path)}")
     
     # 載入音頻
     try:
-        mixture, sr = torchaudio.load(audio_path)
+        mixture, sr = load_audio(audio_path)
         print(f"   原始格式: {mixture.shape}, 採樣率: {sr}")
     except Exception as e:
         print(f"❌ 音頻載入失敗: {e}")
         return None
     
-    # 確保是雙聲道
-    if mixture.shape[0] == 1:
-        mixture = mixture.repeat(2, 1)
-        print("   轉換為雙聲道")
-    elif mixture.shape[0] > 2:
-        mixture = mixture[:2]
+    # 多於兩個聲道時截取前兩個 (切片為視圖，傳輸前轉為連續記憶體)
+    if mixture.shape[0] > 2:
+        mixture = mixture[:2].contiguous()
         print("   截取前兩個聲道")
     
-    # 重採樣到44.1kHz (如果需要)
-    if sr != 44100:
-        resampler = torchaudio.transforms.Resample(sr, 44100)
-        mixture = resampler(mixture)
-        sr = 44100
-        print(f"   重採樣到44.1kHz")
-    
-    # 移到GPU
-    mixture = mixture.to(device)
+    # 先移到GPU，讓重採樣也在GPU上執行
+    if device.type != 'cuda':
+        return mixture.to(device), sr, None
     
-    # 準備標籤向量 (全1表示處理所有聲音)
-    label_vector = torch.ones(1, 20, device=device)
-    
-    # 準備模型輸入
-    inputs = {
-        'mixture': mixture.unsqueeze(0),  # 添加batch維度
-        'label_vector': label_vector
-    }
-    
-    # 推理
-    print("   🔄 執行推理...")
-    start_time = time.time()
+    stream = h2d_stream if h2d_stream is not None else torch.cuda.current_stream(device)
+    mixture = mixture.contiguous().pin_memory()
+    with torch.cuda.stream(stream):
+        mixture = mixture.to(device, non_blocking=True)
+    return mixture, sr, stream.record_event()
+
+def launch_separation(model, uploaded, device, n_labels=20, compute_stream=None):
+    """
+    在計算stream上排入預處理與分段推理 (GPU上不等待完成即返回)
+    返回 (pred_audio [2, T] FP32, 採樣率, 計時)，計時為GPU上的 (開始, 結束) 事件或CPU上的秒數
+    """
+    mixture, sr, uploaded_event = uploaded
     
-    with torch.no_grad():
-        output = model(inputs)
+    if device.type == 'cuda':
+        compute_stream = compute_stream if compute_stream is not None else torch.cuda.current_stream(device)
+        # 計算stream須排在預設stream上的工作 (模型轉換、標籤向量、預熱) 與本文件的上傳之後
+        compute_stream.wait_stream(torch.cuda.current_stream(device))
+        compute_stream.wait_event(uploaded_event)
+        mixture.record_stream(compute_stream)  # 張量由計算stream使用，釋放前需等待其完成
     
-    inference_time = time.time() - start_time
-    audio_duration = mixture.shape[1] / sr
+    with torch.cuda.stream(compute_stream):
+        # 重採樣到44.1kHz (如果需要)
+        if sr != 44100:
+            mixture = get_resampler(sr, device)(mixture)
+            sr = 44100
+            print(f"   重採樣到44.1kHz")
+        
+        # 單聲道在傳輸與重採樣之後才擴展為雙聲道 (expand為零拷貝視圖)
+        if mixture.shape[0] == 1:
+            mixture = mixture.expand(2, -1)
+            print("   轉換為雙聲道")
+        
+        # 轉為模型的精度 (FP16模型需要半精度輸入)，並確保卷積所需的連續記憶體
+        dtype = get_model_dtype(model)
+        mixture = mixture.to(dtype).contiguous()
+        
+        # 準備標籤向量 (全1表示處理所有聲音)
+        label_vector = get_label_vector(n_labels, device, dtype)
+        
+        # 推理
+        print("   🔄 執行推理...")
+        # CUDA為非同步執行，以計算stream上的事件計時，不需同步整個設備
+        if device.type == 'cuda':
+            start_event = torch.cuda.Event(enable_timing=True)
+            end_event = torch.cuda.Event(enable_timing=True)
+            start_event.record(compute_stream)
+            pred_audio = separate_chunked(model, mixture, label_vector, sr)
+            end_event.record(compute_stream)
+            return pred_audio, sr, (start_event, end_event)
+        
+        start_time = time.time()
+        pred_audio = separate_chunked(model, mixture, label_vector, sr)
+        return pred_audio, sr, time.time() - start_time
+
+def save_prediction(pred_audio, sr, timing, audio_path, output_dir, compute_stream=None):
+    """等待推理完成、取回CPU並保存預測音頻，返回輸出路徑"""
+    # 獲取輸出音頻：推理完成後整段一次非同步移到CPU
+    # (不要對輸出逐個調用 .item()，每次都會觸發一次設備同步)
+    if pred_audio.device.type == 'cuda':
+        with torch.cuda.stream(compute_stream):
+            pred_cpu = pred_audio.to('cpu', non_blocking=True)
+            done_event = torch.cuda.current_stream(pred_audio.device).record_event()
+        # 保存前確認非同步複製已完成
+        done_event.synchronize()
+        start_event, end_event = timing
+        inference_time = start_event.elapsed_time(end_event) / 1000
+    else:
+        pred_cpu = pred_audio
+        inference_time = timing
+    audio_duration = pred_cpu.shape[1] / sr
     
     print(f"   ⚡ 推理完成: {inference_time:.3f}秒 (音頻長度: {audio_duration:.1f}秒)")
     print(f"   📊 實時倍數: {audio_duration/inference_time:.1f}x")
     
-    # 獲取輸出音頻
-    pred_audio = output['x'].squeeze(0).cpu()  # 移除batch維度並移到CPU
-    
     # 確保輸出目錄存在
     os.makedirs(output_dir, exist_ok=True)
     
@@ -157,63 +478,143 @@ def process_audio(model, audio_path, output_dir, device):
     output_path = os.path.join(output_dir, f"{input_name}_pred.wav")
     
     # 保存預測音頻
-    torchaudio.save(output_path, pred_audio, sr)
+    # 先編碼到記憶體，再以1 MiB緩衝一次寫入，減少系統調用次數
+    buffer = io.BytesIO()
+    torchaudio.save(buffer, pred_cpu, sr, format='wav')
+    with open(output_path, 'wb', buffering=1 << 20) as f:
+        f.write(buffer.getbuffer())
     print(f"   💾 保存預測音頻: {output_path}")
     
     return output_path
 
+def process_audio(model, audio_path, output_dir, device, n_labels=20, streams=None):
+    """
+    處理音頻文件
+    n_labels: 模型的標籤數 (load_model 返回值)
+    streams: create_streams 建立的 (H2D, 計算) stream，未提供時使用當前stream
+    """
+    h2d_stream, compute_stream = streams or (None, None)
+    uploaded = upload_audio(audio_path, device, h2d_stream)
+    if uploaded is None:
+        return None
+    pred_audio, sr, timing = launch_separation(model, uploaded, device, n_labels, compute_stream)
+    return save_prediction(pred_audio, sr, timing, audio_path, output_dir, compute_stream)
+
+class InferenceEngine:
+    """
+    常駐推理引擎：模型只在建立時載入一次，之後可連續處理多個音頻，
+    避免每個文件都重新反序列化checkpoint、搬移權重與重新預熱
+    """
+    
+    def __init__(self, model_path, device=None, use_fp16=True, use_compile=True, use_tensorrt=False, use_int8=True):
+        self.device = device if device is not None else setup_device()
+        self.streams = create_streams(self.device)
+        self.model, self.epoch, self.n_labels = load_model(
+            model_path, self.device, use_fp16=use_fp16, use_compile=use_compile,
+            use_tensorrt=use_tensorrt, use_int8=use_int8)
+    
+    def process(self, audio_path, output_dir):
+        """處理單個音頻文件，返回輸出路徑 (失敗時為None)"""
+        return process_audio(self.model, audio_path, output_dir, self.device, self.n_labels, self.streams)
+    
+    def process_all(self, audio_paths, output_dir):
+        """
+        依序處理多個音頻文件，返回各文件的輸出路徑 (失敗時為None)
+        GPU上當前文件推理期間，先解碼下一個文件並在H2D stream上傳輸
+        """
+        h2d_stream, compute_stream = self.streams or (None, None)
+        output_paths = []
+        prefetched = None  # (索引, upload_audio結果)：已預先載入的下一個文件
+        
+        for i, audio_path in enumerate(audio_paths):
+            try:
+                if prefetched is not None and prefetched[0] == i:
+                    uploaded = prefetched[1]
+                else:
+                    uploaded = upload_audio(audio_path, self.device, h2d_stream)
+                if uploaded is None:
+                    output_paths.append(None)
+                    continue
+                
+                pred_audio, sr, timing = launch_separation(
+                    self.model, uploaded, self.device, self.n_labels, compute_stream)
+                
+                # 推理已排入計算stream，等待期間解碼並上傳下一個文件
+                # (預取失敗不影響本文件，下一輪會重新載入並在那時報告錯誤)
+                if i + 1 < len(audio_paths):
+                    try:
+                        prefetched = (i + 1, upload_audio(audio_paths[i + 1], self.device, h2d_stream))
+                    except Exception:
+                        prefetched = None
+                
+                output_paths.append(save_prediction(pred_audio, sr, timing, audio_path, output_dir, compute_stream))
+            except Exception as e:
+                print(f"❌ 音頻處理失敗: {e}")
+                import traceback
+                traceback.print_exc()
+                output_paths.append(None)
+        
+        return output_paths
+
 def main():
     """主函數"""
     print("🎯 Web模型應用工具")
     print("=" * 50)
     
-    # 配置
-    model_path = "D:/data_output/eval/Third_200.pt"
-    output_dir = "D:/data_output/eval/web_data"
+    # 配置 (未指定參數時使用預設路徑)
+    parser = argparse.ArgumentParser(description='Web模型應用工具 - 輸入MIX音頻，生成PRED音頻')
+    parser.add_argument('inputs', nargs='*', default=["D:/data_output/eval/web_data/sample_847_mixture.wav"],
+                        help='要處理的音頻文件 (可指定多個)')
+    parser.add_argument('--model', default="D:/data_output/eval/Third_200.pt", help='模型checkpoint路徑')
+    parser.add_argument('--output-dir', default="D:/data_output/eval/web_data", help='輸出目錄')
+    parser.add_argument('--no-fp16', action='store_true', help='GPU上不使用半精度推理 (音質有疑慮時使用)')
+    parser.add_argument('--tensorrt', action='store_true', help='GPU上使用TensorRT引擎 (需安裝tensorrt與trtexec)')
+    parser.add_argument('--no-int8', action='store_true', help='CPU上不使用INT8動態量化 (音質有疑慮時使用)')
+    args = parser.parse_args()
     
-    # 這裡設置你的輸入音頻路徑
-    # 修改下面這行來指定你要處理的音頻文件
-    input_audio_path = "D:/data_output/eval/web_data/sample_847_mixture.wav"
+    model_path = args.model
+    output_dir = args.output_dir
     
     print(f"📁 模型路徑: {model_path}")
     print(f"📁 輸出目錄: {output_dir}")
-    print(f"🎵 輸入音頻: {input_audio_path}")
+    print(f"🎵 輸入音頻: {len(args.inputs)} 個文件")
     
     # 檢查文件是否存在
     if not os.path.exists(model_path):
         print(f"❌ 模型文件不存在: {model_path}")
         return
     
-    if not os.path.exists(input_audio_path):
-        print(f"❌ 輸入音頻文件不存在: {input_audio_path}")
-        print("💡 請修改 input_audio_path 變數指向你的音頻文件")
-        return
+    input_paths = []
+    for input_audio_path in args.inputs:
+        if os.path.exists(input_audio_path):
+            input_paths.append(input_audio_path)
+        else:
+            print(f"❌ 輸入音頻文件不存在: {input_audio_path}")
     
-    # 設置設備
-    device = setup_device()
+    if not input_paths:
+        print("💡 請在命令列指定要處理的音頻文件")
+        return
     
-    # 載入模型
+    # 載入模型 (只載入一次，所有文件共用)
     try:
-        model, epoch = load_model(model_path, device)
+        engine = InferenceEngine(model_path, use_fp16=not args.no_fp16, use_tensorrt=args.tensorrt,
+                                 use_int8=not args.no_int8)
     except Exception as e:
         print(f"❌ 無法載入模型: {e}")
         return
     
     # 處理音頻
-    try:
-        output_path = process_audio(model, input_audio_path, output_dir, device)
-        
-        if output_path:
-            print(f"\n🎉 處理完成！")
+    results = engine.process_all(input_paths, output_dir)
+    for input_audio_path, output_path in zip(input_paths, results):
+        if not output_path:
+            print(f"\n❌ 處理失敗: {input_audio_path}")
+    output_paths = [output_path for output_path in results if output_path]
+    
+    if output_paths:
+        print(f"\n🎉 處理完成！({len(output_paths)}/{len(input_paths)})")
+        for output_path in output_paths:
             print(f"📁 輸出文件: {output_path}")
-            print(f"💡 你可以播放這個文件來聽取語音分離效果")
-        else:
-            print(f"\n❌ 處理失敗")
-            
-    except Exception as e:
-        print(f"❌ 音頻處理失敗: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"💡 你可以播放這些文件來聽取語音分離效果")
 
 if __name__ == "__main__":
     main()